@@ -4,36 +4,161 @@ Module: dashboard.
 This module is responsible to renders a dashboard.
 """
 
+import asyncio
+import calendar
+
+import httpx
+import numpy as np
+import orjson
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
 
 st.set_page_config(layout="wide")
 
 
 URL = "https://labdados.com/produtos"
 REGIONS = ["Brasil", "Centro-Oeste", "Nordeste", "Norte", "Sudeste", "Sul"]
+TIMEOUT = 10
+UNITS = ("", "mil", "million")
+MONTHS = np.array(calendar.month_name[1:])
+CATEGORICAL_COLUMNS = ["Vendedor", "Local da compra", "Categoria do Produto"]
+
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    """
+    Create an HTTP session shared across reruns and user sessions.
+
+    Reusing the session keeps the connection to the API alive, so only the
+    first request pays for the TCP/TLS handshake.
+
+    Returns:
+        requests.Session: A session with a pooled adapter mounted for HTTPS.
+    """
+    session = requests.Session()
+    session.headers.update({"Accept-Encoding": "gzip, deflate"})
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    return session
 
 
+def parse_data(content: bytes) -> pd.DataFrame:
+    """
+    Parse a JSON payload returned by the API into a DataFrame.
+
+    Args:
+        content (bytes): The raw (already decompressed) response body.
+
+    Returns:
+        pd.DataFrame: A DataFrame with Arrow-backed columns, "Data da Compra" parsed
+                    as datetime and the low-cardinality columns as categoricals,
+                    or an empty DataFrame if the payload has no records.
+    """
+    datas = pd.DataFrame.from_dict(orjson.loads(content)).convert_dtypes(
+        dtype_backend="pyarrow"
+    )
+    if datas.empty:
+        return datas
+    datas["Data da Compra"] = pd.to_datetime(
+        datas["Data da Compra"], format="%d/%m/%Y", cache=True
+    )
+    datas[CATEGORICAL_COLUMNS] = datas[CATEGORICAL_COLUMNS].astype("category")
+    return datas
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
 def fetch_data(params: dict) -> pd.DataFrame:
     """
     Fetch data from the given URL with specified parameters.
 
+    Results are cached per ``params`` for an hour, so reruns triggered by
+    widget interactions don't hit the API again. Errors are raised rather than
+    returned, so a failed request is never cached.
+
     Args:
         params (dict): A dictionary of query parameters to include in the request.
 
     Returns:
-        pd.DataFrame: A DataFrame containing the fetched data, or an empty DataFrame
-                    if an error occurs during the request.
+        pd.DataFrame: A DataFrame containing the fetched data, with "Data da Compra"
+                    parsed as datetime and the low-cardinality columns as
+                    categoricals.
+
+    Raises:
+        requests.exceptions.RequestException: If the request fails.
+        orjson.JSONDecodeError: If the response body is not valid JSON.
+        KeyError: If the payload is missing an expected column.
     """
-    try:
-        response = requests.get(URL, params=params)
-        response.raise_for_status()  # Raise an error for bad responses (4xx or 5xx)
-        return pd.DataFrame.from_dict(response.json())
-    except requests.exceptions.RequestException as e:
-        st.error(f"Error fetching data: {e}")
-        return pd.DataFrame()  # Return an empty DataFrame in case of an error
+    response = get_session().get(URL, params=params, timeout=TIMEOUT)
+    response.raise_for_status()  # Raise an error for bad responses (4xx or 5xx)
+    # response.content is already gzip-decoded by urllib3
+    return parse_data(response.content)
+
+
+async def fetch_regions(regions: list[str]) -> list[bytes | None]:
+    """
+    Fetch the whole-period data of every given region concurrently.
+
+    Args:
+        regions (list[str]): The "regiao" query values to fetch.
+
+    Returns:
+        list[bytes | None]: The response bodies, in the same order as ``regions``,
+                    with None for the regions whose request failed.
+    """
+    async with httpx.AsyncClient(
+        http2=True,
+        timeout=TIMEOUT,
+        limits=httpx.Limits(max_connections=8),
+    ) as client:
+        responses = await asyncio.gather(
+            *(client.get(URL, params={"regiao": r, "ano": 0}) for r in regions),
+            return_exceptions=True,
+        )
+
+    contents = []
+    for response in responses:
+        if isinstance(response, httpx.HTTPError):
+            contents.append(None)
+        elif isinstance(response, BaseException):
+            raise response
+        else:
+            contents.append(None if response.is_error else response.content)
+    return contents
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_all_regions() -> dict[str, pd.DataFrame]:
+    """
+    Prefetch the whole-period data of every region, so switching regions in the
+    sidebar doesn't wait on the API.
+
+    Returns:
+        dict[str, pd.DataFrame]: The parsed data keyed by "regiao" query value.
+                    Regions whose request failed or whose payload can't be
+                    parsed are left out, so callers fall back to `fetch_data`
+                    for them.
+
+    Raises:
+        httpx.HTTPError: If every request fails. Errors are raised rather than
+                    returned, so a fully failed prefetch is never cached.
+    """
+    regions = ["" if r == "Brasil" else r.lower() for r in REGIONS]
+    contents = asyncio.run(fetch_regions(regions))
+    if all(content is None for content in contents):
+        raise httpx.HTTPError("Every region request failed")
+
+    datas = {}
+    for r, content in zip(regions, contents):
+        if content is None:
+            continue
+        try:
+            datas[r] = parse_data(content)
+        except (KeyError, ValueError):  # orjson.JSONDecodeError is a ValueError
+            continue
+    return datas
 
 
 def format_number(value: int | float, prefix="") -> str:
@@ -50,12 +175,145 @@ def format_number(value: int | float, prefix="") -> str:
     Returns:
         str: The formatted number as a string, including the prefix and appropriate unit.
     """
-    for unit in ["", "mil"]:
-        if value < 1000:
-            return f"{prefix} {value:.2f} {unit}"
-        value /= 1000
+    scale = 0 if value < 1_000 else 1 if value < 1_000_000 else 2
+    return f"{prefix} {value / 1000**scale:.2f} {UNITS[scale]}"
+
+
+def format_number_array(values: np.ndarray, prefix="") -> np.ndarray:
+    """
+    Vectorized version of `format_number` for an array of numeric values.
+
+    Args:
+        values (np.ndarray): The numeric values to be formatted.
+        prefix (str): An optional prefix to be added before each formatted number.
+
+    Returns:
+        np.ndarray: An array with the formatted numbers as strings.
+    """
+    values = np.asarray(values, dtype=float)
+    scale = np.digitize(values, [1_000, 1_000_000])
+    numbers = np.char.mod("%.2f", values / 1000.0**scale)
+    units = np.asarray(UNITS)[scale]
+    return np.char.add(np.char.add(f"{prefix} ", numbers), np.char.add(" ", units))
+
+
+@st.cache_data(ttl=3600, max_entries=32, show_spinner=False)
+def build_state_map(states: pd.DataFrame, title: str) -> go.Figure:
+    """
+    Build a bubble map of the given per-state values over South America.
+
+    Args:
+        states (pd.DataFrame): Per-state table with "Local da compra", "lat",
+                    "lon" and "Preço" columns.
+        title (str): The chart title.
+
+    Returns:
+        go.Figure: The map figure.
+    """
+    return px.scatter_geo(
+        states,
+        lat="lat",
+        lon="lon",
+        scope="south america",
+        size="Preço",
+        template="seaborn",
+        hover_name="Local da compra",
+        hover_data={"lat": False, "lon": False},
+        title=title,
+    )
+
+
+@st.cache_data(ttl=3600, max_entries=32, show_spinner=False)
+def build_monthly_line(
+    monthly: pd.DataFrame, title: str, yaxis_title: str
+) -> go.Figure:
+    """
+    Build a line chart of monthly values with one line per year.
+
+    Args:
+        monthly (pd.DataFrame): Monthly table with "Mes", "Ano" and "Preço" columns.
+        title (str): The chart title.
+        yaxis_title (str): The y axis title.
+
+    Returns:
+        go.Figure: The line figure.
+    """
+    fig = px.line(
+        monthly,
+        x="Mes",
+        y="Preço",
+        markers=True,
+        range_y=(0, monthly["Preço"].max()),
+        color="Ano",
+        line_dash="Ano",
+        title=title,
+    )
+    fig.update_layout(yaxis_title=yaxis_title)
+    return fig
+
+
+@st.cache_data(ttl=3600, max_entries=32, show_spinner=False)
+def build_states_bar(
+    states: pd.DataFrame, title: str, yaxis_title: str
+) -> go.Figure:
+    """
+    Build a bar chart of the given per-state values.
 
-    return f"{prefix} {value:.2f} million"
+    Args:
+        states (pd.DataFrame): Per-state table with "Local da compra" and "Preço"
+                    columns.
+        title (str): The chart title.
+        yaxis_title (str): The y axis title.
+
+    Returns:
+        go.Figure: The bar figure.
+    """
+    fig = px.bar(
+        states,
+        x="Local da compra",
+        y="Preço",
+        text_auto=True,
+        title=title,
+    )
+    fig.update_layout(yaxis_title=yaxis_title)
+    return fig
+
+
+@st.cache_data(ttl=3600, max_entries=32, show_spinner=False)
+def build_categories_bar(
+    categories: pd.DataFrame, title: str, yaxis_title: str, showlegend: bool = True
+) -> go.Figure:
+    """
+    Build a bar chart of the given per-category values.
+
+    Args:
+        categories (pd.DataFrame): Per-category table indexed by category.
+        title (str): The chart title.
+        yaxis_title (str): The y axis title.
+        showlegend (bool): Whether to display the legend.
+
+    Returns:
+        go.Figure: The bar figure.
+    """
+    fig = px.bar(categories, text_auto=True, title=title)
+    fig.update_layout(showlegend=showlegend, yaxis_title=yaxis_title)
+    return fig
+
+
+@st.cache_data(ttl=3600, max_entries=32, show_spinner=False)
+def build_sellers_bar(sellers: pd.DataFrame, column: str, title: str) -> go.Figure:
+    """
+    Build a horizontal bar chart of the given per-seller values.
+
+    Args:
+        sellers (pd.DataFrame): Per-seller table indexed by seller.
+        column (str): The column to plot.
+        title (str): The chart title.
+
+    Returns:
+        go.Figure: The bar figure.
+    """
+    return px.bar(sellers, x=column, y=sellers.index, text_auto=True, title=title)
 
 
 st.sidebar.title("Filters", anchor=False)
@@ -73,165 +331,133 @@ else:
 
 query_string = {"regiao": region.lower(), "ano": year if not every_year else 0}
 
-datas = fetch_data(query_string)
-datas["Data da Compra"] = pd.to_datetime(datas["Data da Compra"], format="%d/%m/%Y")
+datas = None
+if every_year:
+    try:
+        datas = fetch_all_regions().get(query_string["regiao"])
+    except httpx.HTTPError:
+        pass  # fall back to fetching the selected region only
+if datas is None:
+    try:
+        datas = fetch_data(query_string)
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error fetching data: {e}")
+        st.stop()
+    except (KeyError, ValueError) as e:  # orjson.JSONDecodeError is a ValueError
+        st.error(f"Unexpected data returned by the API: {e!r}")
+        st.stop()
+
+if datas.empty:
+    st.warning("No data found for the selected filters.")
+    st.stop()
 
 seller_filter: str = st.sidebar.multiselect(
-    "Sellers", datas["Vendedor"].unique(), placeholder="Sellers"
+    "Sellers", datas["Vendedor"].cat.categories, placeholder="Sellers"
 )
 if seller_filter:
-    datas = datas[datas["Vendedor"].isin(seller_filter)]
+    seller_codes = datas["Vendedor"].cat.categories.get_indexer(seller_filter)
+    datas = datas.loc[np.isin(datas["Vendedor"].cat.codes.to_numpy(), seller_codes)]
 
-monthly_income = (
-    datas.set_index("Data da Compra")
-    .groupby(pd.Grouper(freq="M"))["Preço"]
-    .sum()
+total_income = datas["Preço"].sum()
+total_sales = len(datas)
+
+st.title("SALES DASHBOARD :shopping_trolley:", anchor=False)
+
+## Tables
+state_agg = (
+    datas.groupby("Local da compra", observed=True, sort=False)
+    .agg(
+        lat=("lat", "first"),
+        lon=("lon", "first"),
+        total=("Preço", "sum"),
+        count=("Preço", "count"),
+    )
     .reset_index()
 )
-monthly_income["Ano"] = monthly_income["Data da Compra"].dt.year
-monthly_income["Mes"] = monthly_income["Data da Compra"].dt.month_name()
 
-income_by_category = (
-    datas.groupby("Categoria do Produto")[["Preço"]]
-    .sum()
-    .sort_values("Preço", ascending=False)
+monthly = (
+    datas.resample("ME", on="Data da Compra")["Preço"]
+    .agg(["sum", "count"])
+    .reset_index()
 )
+monthly["Ano"] = monthly["Data da Compra"].dt.year
+monthly["Mes"] = MONTHS[monthly["Data da Compra"].dt.month.to_numpy() - 1]
 
-st.title("SALES DASHBOARD :shopping_trolley:", anchor=False)
-
-## Tables
 ### Income tables
-income_of_the_states = datas.groupby("Local da compra")[["Preço"]].sum()
 income_of_the_states = (
-    datas.drop_duplicates(subset="Local da compra")[["Local da compra", "lat", "lon"]]
-    .merge(income_of_the_states, left_on="Local da compra", right_index=True)
+    state_agg[["Local da compra", "lat", "lon", "total"]]
+    .rename(columns={"total": "Preço"})
+    .sort_values("Preço", ascending=False)
+)
+
+monthly_income = monthly.drop(columns="count").rename(columns={"sum": "Preço"})
+
+income_by_category = (
+    datas.groupby("Categoria do Produto", observed=True, sort=False)[["Preço"]]
+    .sum()
     .sort_values("Preço", ascending=False)
 )
 
 ### Sales quantity tables
-vendas_estados = pd.DataFrame(datas.groupby("Local da compra")["Preço"].count())
 vendas_estados = (
-    datas.drop_duplicates(subset="Local da compra")[["Local da compra", "lat", "lon"]]
-    .merge(vendas_estados, left_on="Local da compra", right_index=True)
+    state_agg[["Local da compra", "lat", "lon", "count"]]
+    .rename(columns={"count": "Preço"})
     .sort_values("Preço", ascending=False)
 )
 
-vendas_mensal = pd.DataFrame(
-    datas.set_index("Data da Compra").groupby(pd.Grouper(freq="M"))["Preço"].count()
-).reset_index()
-vendas_mensal["Ano"] = vendas_mensal["Data da Compra"].dt.year
-vendas_mensal["Mes"] = vendas_mensal["Data da Compra"].dt.month_name()
+vendas_mensal = monthly.drop(columns="sum").rename(columns={"count": "Preço"})
 
-vendas_categorias = pd.DataFrame(
-    datas.groupby("Categoria do Produto")["Preço"].count().sort_values(ascending=False)
-)
+vendas_categorias = datas["Categoria do Produto"].value_counts().to_frame("Preço")
+# Categorical value_counts also lists categories emptied by the seller filter
+vendas_categorias = vendas_categorias[vendas_categorias["Preço"] > 0]
 
 ### Seller table
-vendedores = pd.DataFrame(datas.groupby("Vendedor")["Preço"].agg(["sum", "count"]))
-
-## Graphs
-fig_map_income = px.scatter_geo(
-    income_of_the_states,
-    lat="lat",
-    lon="lon",
-    scope="south america",
-    size="Preço",
-    template="seaborn",
-    hover_name="Local da compra",
-    hover_data={"lat": False, "lon": False},
-    title="Income by state",
-)
-
-fig_monthly_income = px.line(
-    monthly_income,
-    x="Mes",
-    y="Preço",
-    markers=True,
-    range_y=(0, monthly_income.max()),
-    color="Ano",
-    line_dash="Ano",
-    title="Monthly income",
-)
-
-fig_monthly_income.update_layout(yaxis_title="Receita")
-
-fig_income_of_the_states = px.bar(
-    income_of_the_states.head(),
-    x="Local da compra",
-    y="Preço",
-    text_auto=True,
-    title="Top states (Income)",
+vendedores = datas.groupby("Vendedor", observed=True, sort=False)["Preço"].agg(
+    ["sum", "count"]
 )
 
-fig_income_of_the_states.update_layout(yaxis_title="Income")
-
-fig_income_by_categories = px.bar(
-    income_by_category, text_auto=True, title="Income by categories"
+## Graphs
+fig_map_income = build_state_map(income_of_the_states, "Income by state")
+fig_monthly_income = build_monthly_line(monthly_income, "Monthly income", "Receita")
+fig_income_of_the_states = build_states_bar(
+    income_of_the_states.head(), "Top states (Income)", "Income"
 )
-
-fig_income_by_categories.update_layout(yaxis_title="Income")
-
-fig_mapa_vendas = px.scatter_geo(
-    vendas_estados,
-    lat="lat",
-    lon="lon",
-    scope="south america",
-    template="seaborn",
-    size="Preço",
-    hover_name="Local da compra",
-    hover_data={"lat": False, "lon": False},
-    title="Sales by state",
+fig_income_by_categories = build_categories_bar(
+    income_by_category, "Income by categories", "Income"
 )
 
-fig_vendas_mensal = px.line(
-    vendas_mensal,
-    x="Mes",
-    y="Preço",
-    markers=True,
-    range_y=(0, vendas_mensal.max()),
-    color="Ano",
-    line_dash="Ano",
-    title="Monthly sales amount",
+fig_mapa_vendas = build_state_map(vendas_estados, "Sales by state")
+fig_vendas_mensal = build_monthly_line(
+    vendas_mensal, "Monthly sales amount", "Sales quantity"
 )
-
-fig_vendas_mensal.update_layout(yaxis_title="Sales quantity")
-
-fig_vendas_estados = px.bar(
-    vendas_estados.head(),
-    x="Local da compra",
-    y="Preço",
-    text_auto=True,
-    title="Top 5 states",
+fig_vendas_estados = build_states_bar(
+    vendas_estados.head(), "Top 5 states", "Sales quantity"
 )
-
-fig_vendas_estados.update_layout(yaxis_title="Sales quantity")
-
-fig_vendas_categorias = px.bar(
-    vendas_categorias, text_auto=True, title="Sales by categories"
+fig_vendas_categorias = build_categories_bar(
+    vendas_categorias, "Sales by categories", "Sales quantity", showlegend=False
 )
-fig_vendas_categorias.update_layout(showlegend=False, yaxis_title="Sales quantity")
 
 ## Streamlit visualization
 tab1, tab2, tab3 = st.tabs(["Income", "Sales quantity", "Sellers"])
 with tab1:
     coluna1, coluna2 = st.columns(2)
     with coluna1:
-        st.metric("Income", format_number(datas["Preço"].sum(), "R$"))
+        st.metric("Income", format_number(total_income, "R$"))
         st.plotly_chart(fig_map_income, use_container_width=True)
         st.plotly_chart(fig_income_of_the_states, use_container_width=True)
     with coluna2:
-        st.metric("Sales quantity", format_number(datas.shape[0]))
+        st.metric("Sales quantity", format_number(total_sales))
         st.plotly_chart(fig_monthly_income, use_container_width=True)
         st.plotly_chart(fig_income_by_categories, use_container_width=True)
 
 with tab2:
     coluna1, coluna2 = st.columns(2)
     with coluna1:
-        st.metric("Income", format_number(datas["Preço"].sum(), "R$"))
+        st.metric("Income", format_number(total_income, "R$"))
         st.plotly_chart(fig_mapa_vendas, use_container_width=True)
         st.plotly_chart(fig_vendas_estados, use_container_width=True)
     with coluna2:
-        st.metric("Sales quantity", format_number(datas.shape[0]))
+        st.metric("Sales quantity", format_number(total_sales))
         st.plotly_chart(fig_vendas_mensal, use_container_width=True)
         st.plotly_chart(fig_vendas_categorias, use_container_width=True)
 
@@ -239,32 +465,16 @@ with tab3:
     qtd_vendedores = st.number_input("Number of sellers", 2, 10, 5)
     coluna1, coluna2 = st.columns(2)
     with coluna1:
-        st.metric("Income", format_number(datas["Preço"].sum(), "R$"))
-        fig_receita_vendedores = px.bar(
-            vendedores[["sum"]]
-            .sort_values("sum", ascending=False)
-            .head(qtd_vendedores),
-            x="sum",
-            y=vendedores[["sum"]]
-            .sort_values("sum", ascending=False)
-            .head(qtd_vendedores)
-            .index,
-            text_auto=True,
-            title=f"Top {qtd_vendedores} sellers (income)",
+        st.metric("Income", format_number(total_income, "R$"))
+        top_income = vendedores[["sum"]].nlargest(qtd_vendedores, "sum")
+        fig_receita_vendedores = build_sellers_bar(
+            top_income, "sum", f"Top {qtd_vendedores} sellers (income)"
         )
         st.plotly_chart(fig_receita_vendedores)
     with coluna2:
-        st.metric("Sales quantity", format_number(datas.shape[0]))
-        fig_vendas_vendedores = px.bar(
-            vendedores[["count"]]
-            .sort_values("count", ascending=False)
-            .head(qtd_vendedores),
-            x="count",
-            y=vendedores[["count"]]
-            .sort_values("count", ascending=False)
-            .head(qtd_vendedores)
-            .index,
-            text_auto=True,
-            title=f"Top {qtd_vendedores} sellers (sales quantity)",
+        st.metric("Sales quantity", format_number(total_sales))
+        top_count = vendedores[["count"]].nlargest(qtd_vendedores, "count")
+        fig_vendas_vendedores = build_sellers_bar(
+            top_count, "count", f"Top {qtd_vendedores} sellers (sales quantity)"
         )
         st.plotly_chart(fig_vendas_vendedores)